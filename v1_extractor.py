@@ -1,8 +1,17 @@
-import requests
+import aiohttp
+import argparse
+import asyncio
 import time
-import json
 import logging
+import orjson
+import os
+import shelve
+import random
 import string
+from bisect import bisect_right
+from urllib.parse import quote_plus
+from email.utils import parsedate_to_datetime
+from aiolimiter import AsyncLimiter
 
 # Configure logging
 logging.basicConfig(
@@ -13,123 +22,289 @@ logging.basicConfig(
         logging.StreamHandler()
     ]
 )
+logger = logging.getLogger(__name__)
 
 class AutocompleteExtractor:
-    def __init__(self, base_url, max_results=50, rate_limit_delay=0.2):
+    def __init__(self, base_url, max_results=50, permitted_rps=5.0, max_concurrency=15, resume=False):
         self.base_url = base_url
         self.max_results = max_results
-        self.rate_limit_delay = rate_limit_delay
+        self.permitted_rps = permitted_rps
+        self.max_concurrency = max_concurrency
+        self.resume = resume
+        
+        # Only the query changes between requests, so build the rest of the URL once
+        self._url_prefix = f"{base_url}/v1/autocomplete?max_results={max_results}&query="
         self.discovered_names = set()
         self.request_count = 0
         
-    def get_autocomplete_suggestions(self, query):
-        url = f"{self.base_url}/v1/autocomplete?query={query}&max_results={self.max_results}"
+        # Every prefix ever queued, so each prefix is fetched at most once
+        self._scheduled = set()
+        
+        # Token bucket shared by all workers, undershooting the server's cap slightly
+        self.limiter = AsyncLimiter(permitted_rps * 0.95, 1)
+        
+        # Persistent prefix cache keyed by "<api version>:<prefix>", shared across runs with --resume
+        self.cache_file = "prefix_cache.db"
+        self._cache = None
+        self.cache_hits = 0
+        
+        # Append-only NDJSON log of names, flushed after every response so a crash loses nothing
+        self.names_file = "names_v1.ndjson"
+        self._names_sink = None
+        
+        # Created inside the event loop by crawl()
+        self.session = None
+        self.sem = None
+        self.prefix_queue = None
+        
+    async def get_autocomplete_suggestions(self, query, max_retries=5):
+        cache_key = f"v1:{query}"
+        if self.resume and cache_key in self._cache:
+            self.cache_hits += 1
+            suggestions, _ = self._cache[cache_key]
+            return suggestions
+        
+        url = self._url_prefix + quote_plus(query)
         
         try:
-            response = requests.get(url)
-            self.request_count += 1
-            
-            # Handle rate limiting
-            if response.status_code == 429:
-                logging.warning(f"Rate limited. Sleeping for 1 second.")
-                time.sleep(1)
-                return self.get_autocomplete_suggestions(query)
-            
-            if response.status_code != 200:
-                logging.error(f"Error status code: {response.status_code}")
-                time.sleep(1)
+            # Retry rate-limited and failed requests in a loop rather than recursing, so retries never grow the stack
+            for retry_count in range(max_retries + 1):
+                try:
+                    # Only the request itself holds a semaphore slot, backoff sleeps do not
+                    async with self.sem, self.limiter:
+                        async with self.session.get(url) as response:
+                            self.request_count += 1
+                            status = response.status
+                            retry_after = self._parse_retry_after(response.headers.get("Retry-After"))
+                            data = orjson.loads(await response.read()) if status == 200 else None
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    # Connection failures and read timeouts are transient, so retry them like a 429
+                    wait_time = random.uniform(0, min(30, 2 ** retry_count))
+                    logger.error("Request error querying '%s': %s. Retrying in %.2fs", query, e, wait_time)
+                    await asyncio.sleep(wait_time)
+                    continue
+                
+                if status != 429:
+                    break
+                
+                # Prefer the server's Retry-After over our own backoff
+                if retry_after is not None:
+                    wait_time = retry_after
+                else:
+                    # Full-jitter exponential backoff capped at 30 seconds, so workers don't retry in lockstep
+                    wait_time = random.uniform(0, min(30, 2 ** retry_count))
+                logger.warning("Rate limited. Sleeping for %.2f seconds. (Retry %d/%d)", wait_time, retry_count + 1, max_retries)
+                await asyncio.sleep(wait_time)
+            else:
+                logger.error("Max retries reached for query '%s'. Skipping.", query)
                 return []
             
-            data = response.json()
+            if status != 200:
+                logger.error("Error status code: %d", status)
+                await asyncio.sleep(1)
+                return []
             
             if "results" in data and isinstance(data["results"], list):
                 suggestions = data["results"]
-                logging.info(f"Query '{query}' returned {len(suggestions)} suggestions")
+                logger.info("Query '%s' returned %d suggestions", query, len(suggestions))
                 
-                if suggestions and len(suggestions) > 0:
-                    logging.debug(f"First: {suggestions[0]}, Last: {suggestions[-1]}")
+                if suggestions and logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("First: %s, Last: %s", suggestions[0], suggestions[-1])
+                
+                # Write through so a rerun with --resume skips this prefix
+                self._cache[cache_key] = (suggestions, time.time())
                 
                 return suggestions
             else:
-                logging.warning(f"Unexpected response format: {data.keys()}")
+                logger.warning("Unexpected response format: %s", data.keys())
                 return []
             
         except Exception as e:
-            logging.error(f"Error querying '{query}': {str(e)}")
-            time.sleep(2)
+            logger.error("Error querying '%s': %s", query, e)
+            await asyncio.sleep(2)
             return []
     
     def crawl_autocomplete(self):
-        logging.info(f"Starting extraction with max_results={self.max_results}")
+        logger.info("Starting extraction with max_results=%d and %d concurrent requests", self.max_results, self.max_concurrency)
         start_time = time.time()
         
-        # Start with single letters
-        for first_letter in string.ascii_lowercase:
-            self.explore_prefix(first_letter)
+        if self.resume:
+            self._load_names()
+        
+        self._cache = shelve.open(self.cache_file)
+        self._names_sink = open(self.names_file, 'ab' if self.resume else 'wb')
+        try:
+            asyncio.run(self.crawl())
+        finally:
+            self._cache.close()
+            self._names_sink.close()
             
         elapsed_time = time.time() - start_time
-        logging.info(f"Extraction completed in {elapsed_time:.2f} seconds")
-        logging.info(f"Total API requests: {self.request_count}")
-        logging.info(f"Total names discovered: {len(self.discovered_names)}")
+        logger.info("Extraction completed in %.2f seconds", elapsed_time)
+        logger.info("Total API requests: %d", self.request_count)
+        logger.info("Prefixes served from cache: %d", self.cache_hits)
+        logger.info("Total names discovered: %d", len(self.discovered_names))
         
         return self.discovered_names
     
-    def explore_prefix(self, prefix):
+    async def crawl(self):
+        """
+        Run a pool of workers over the prefix queue until every prefix is explored.
         """
-        Explore a prefix and all necessary follow-up prefixes.
+        self.sem = asyncio.Semaphore(self.max_concurrency)
+        self.prefix_queue = asyncio.Queue()
+        
+        # One keep-alive pool for the whole crawl; idle sockets outlive backoff sleeps
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=3, sock_read=10)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            self.session = session
+            
+            # Start with single letters
+            for first_letter in string.ascii_lowercase:
+                self._enqueue(first_letter)
+            
+            workers = [asyncio.create_task(self.worker()) for _ in range(self.max_concurrency)]
+            await self.prefix_queue.join()
+            
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+    
+    async def worker(self):
+        """Pull prefixes off the queue until crawl() cancels us"""
+        while True:
+            prefix = await self.prefix_queue.get()
+            try:
+                await self.explore_prefix(prefix)
+            except Exception as e:
+                logger.error("Error exploring prefix '%s': %s", prefix, e)
+            finally:
+                self.prefix_queue.task_done()
+    
+    async def explore_prefix(self, prefix):
+        """
+        Explore a prefix and queue all necessary follow-up prefixes.
         Takes the second letter of the last result when needed to optimize the exploration.
         """
-        logging.info(f"Processing prefix: '{prefix}'")
+        logger.info("Processing prefix: '%s'", prefix)
+        
+        # Bind what the fan-out below uses to locals, saving attribute lookups per child
+        max_results = self.max_results
+        charset = string.ascii_lowercase
+        enqueue = self._enqueue
+        prefix_len = len(prefix)
         
-        suggestions = self.get_autocomplete_suggestions(prefix)
+        suggestions = await self.get_autocomplete_suggestions(prefix)
+        saturated = len(suggestions) >= max_results
         
-        # Add all suggestions to our discovered names
-        for name in suggestions:
-            self.discovered_names.add(name)
+        # Add all suggestions to our discovered names in one set operation, logging the new ones to the NDJSON file
+        new_names = set(suggestions).difference(self.discovered_names)
+        if new_names:
+            self.discovered_names.update(new_names)
+            self._names_sink.write(b"".join(orjson.dumps(name) + b"\n" for name in new_names))
+            self._names_sink.flush()
         
-        # If we got exactly max_results, we need to explore further
-        if len(suggestions) == self.max_results:
+        # If we got max_results (or more, should the server ever overshoot), we need to explore further
+        if saturated:
             last_result = suggestions[-1]
             
-            if len(prefix) < len(last_result):
+            if prefix_len < len(last_result):
                 # Take the next letter from the last result
-                next_letter = last_result[len(prefix)]
-                next_prefix = prefix + next_letter
-                self.explore_prefix(next_prefix)
+                next_letter = last_result[prefix_len]
+                enqueue(prefix + next_letter)
                 
                 # Now, continue with the remaining letters of the alphabet
-                # Start from the letter after the one we just used
-                for c in string.ascii_lowercase:
-                    if c > next_letter:  # Only try letters after the one we already used
-                        new_prefix = prefix + c
-                        self.explore_prefix(new_prefix)
+                # The alphabet is sorted, so the letters after the one we just used are a slice
+                for c in charset[bisect_right(charset, next_letter):]:
+                    enqueue(prefix + c)
             else:
                 # This is an edge case - if the last result is exactly the prefix
                 # Try all letters as we don't know where to go next
-                for c in string.ascii_lowercase:
-                    new_prefix = prefix + c
-                    self.explore_prefix(new_prefix)
+                for c in charset:
+                    enqueue(prefix + c)
+    
+    def _enqueue(self, prefix):
+        """
+        Queue a prefix for exploration unless it was already scheduled.
+        The queue is FIFO, so prefixes are explored breadth-first.
+        Only saturated prefixes queue children, so no ancestor of a queued prefix
+        can already have listed every name under it.
+        """
+        if prefix in self._scheduled:
+            return
+        self._scheduled.add(prefix)
+        self.prefix_queue.put_nowait(prefix)
+    
+    def _parse_retry_after(self, value):
+        """
+        Parse a Retry-After header given either as delay seconds or as an HTTP-date.
+        Returns the number of seconds to wait, or None if the header is missing or malformed.
+        """
+        if value is None:
+            return None
+        
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
         
-        time.sleep(self.rate_limit_delay)
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    
+    def _load_names(self):
+        """Preload names logged to the NDJSON file by a previous run"""
+        if not os.path.exists(self.names_file):
+            return
+        
+        line = b""
+        with open(self.names_file, 'rb') as f:
+            for line in f:
+                try:
+                    self.discovered_names.add(orjson.loads(line))
+                except orjson.JSONDecodeError:
+                    # A crash can leave a truncated last line behind
+                    logger.warning("Skipping malformed line in %s", self.names_file)
+        
+        # Terminate a truncated last line so appended names start on a line of their own
+        if line and not line.endswith(b"\n"):
+            with open(self.names_file, 'ab') as f:
+                f.write(b"\n")
+        
+        logger.info("Loaded %d names from %s", len(self.discovered_names), self.names_file)
     
     def save_results(self, output_file="discovered_names.json"):
         results = {
             "total_requests": self.request_count,
             "total_names": len(self.discovered_names),
-            "names": sorted(list(self.discovered_names))
+            "names": sorted(self.discovered_names)
         }
         
-        with open(output_file, 'w') as f:
-            json.dump(results, f, indent=2)
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
         
-        logging.info(f"Results saved to {output_file}")
+        logger.info("Results saved to %s", output_file)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Extract all names from the v1 autocomplete API")
+    parser.add_argument("--resume", action="store_true", help="Reuse prefix responses cached by a previous run")
+    parser.add_argument("--concurrency", type=int, default=15, help="Number of prefixes crawled in parallel (default: 15)")
+    parser.add_argument("--rps", type=float, default=5.0, help="Requests per second the server tolerates (default: 5.0)")
+    args = parser.parse_args()
+    if args.concurrency <= 0:
+        parser.error("--concurrency must be a positive integer")
+    if not args.rps > 0:
+        parser.error("--rps must be a positive number")
+    
     extractor = AutocompleteExtractor(
         base_url="http://35.200.185.69:8000",
         max_results=50,
-        rate_limit_delay=0.2
+        permitted_rps=args.rps,
+        max_concurrency=args.concurrency,
+        resume=args.resume
     )
     
     all_names = extractor.crawl_autocomplete()
@@ -1,8 +1,18 @@
-import requests
+import aiohttp
+import argparse
+import asyncio
 import time
-import json
 import logging
+import orjson
+import os
+import shelve
+import random
 import string
+from bisect import bisect_right
+from urllib.parse import quote_plus
+from collections import deque
+from email.utils import parsedate_to_datetime
+from aiolimiter import AsyncLimiter
 
 # Configure logging
 logging.basicConfig(
@@ -13,185 +23,437 @@ logging.basicConfig(
         logging.StreamHandler()
     ]
 )
+logger = logging.getLogger(__name__)
 
 class AutocompleteExtractor:
-    def __init__(self, base_url, max_results=50, rate_limit_delay=0.5):
+    def __init__(self, base_url, max_results=50, permitted_rps=2.0, max_concurrency=15, resume=False):
         self.base_url = base_url
         self.max_results = max_results
-        self.rate_limit_delay = rate_limit_delay
+        self.permitted_rps = permitted_rps
+        self.max_concurrency = max_concurrency
+        self.resume = resume
+        
+        # Only the query changes between requests, so build the rest of the URL once
+        self._url_prefix = f"{base_url}/v2/autocomplete?max_results={max_results}&query="
+        
         self.discovered_names = set()
         self.request_count = 0
-        self.consecutive_success = 0
-        self.adaptive_delay = rate_limit_delay
+        self.adaptive_delay = 1 / permitted_rps  # Seconds per request across all workers
         self.max_adaptive_delay = 2.0  # Maximum delay in seconds
-        self.min_adaptive_delay = 0.5  # Minimum delay in seconds
+        self.min_adaptive_delay = self.adaptive_delay  # Never go faster than the permitted rate
+        self.rate_step = permitted_rps / 8  # Requests per second added back after each success
+        self._last_decrease = 0.0  # Monotonic time the delay was last doubled
+        self._next_slot = 0.0  # Event loop time at which the throttle admits the next request
+        
+        # Token bucket shared by all workers, undershooting the server's cap slightly
+        self.limiter = AsyncLimiter(permitted_rps * 0.95, 1)
+        
+        # Circuit breaker: open for a cooldown when most recent requests fail, then let one probe through
+        self.breaker_cooldown = 30  # Seconds
+        self._failure_window = deque(maxlen=20)
+        self._breaker_open_until = 0.0
+        self._breaker_half_open = False
+        self._breaker_probe_in_flight = False
         
         # Define alphanumeric characters (0-9, a-z)
         # Numbers have higher priority than letters (per ASCII ordering)
         self.charset = string.digits + string.ascii_lowercase
         
-    def get_autocomplete_suggestions(self, query, retry_count=0, max_retries=5):
+        # Every prefix ever queued, so each prefix is fetched at most once
+        self._scheduled = set()
+        
+        # Persistent prefix cache keyed by "<api version>:<prefix>", shared across runs with --resume
+        self.cache_file = "prefix_cache.db"
+        self._cache = None
+        self.cache_hits = 0
+        
+        # Append-only NDJSON log of names, flushed after every response so a crash loses nothing
+        self.names_file = "names_v2.ndjson"
+        self._names_sink = None
+        
+        # Created inside the event loop by crawl()
+        self.session = None
+        self.sem = None
+        self.prefix_queue = None
+        
+    async def get_autocomplete_suggestions(self, query, max_retries=5):
         # Updated to use the v2 API endpoint
-        url = f"{self.base_url}/v2/autocomplete?query={query}&max_results={self.max_results}"
+        cache_key = f"v2:{query}"
+        if self.resume and cache_key in self._cache:
+            self.cache_hits += 1
+            suggestions, _ = self._cache[cache_key]
+            return suggestions
         
-        try:
-            response = requests.get(url)
-            self.request_count += 1
+        url = self._url_prefix + quote_plus(query)
+        
+        # Retry in a loop rather than recursing, so retries never grow the stack
+        for retry_count in range(max_retries + 1):
+            probe = await self._wait_for_breaker()
+            await self._throttle()
             
-                            # Handle rate limiting with exponential backoff
-            if response.status_code == 429:
-                wait_time = min(30, 2 ** retry_count)  # Exponential backoff capped at 30 seconds
-                logging.warning(f"Rate limited. Sleeping for {wait_time} seconds. (Retry {retry_count+1}/{max_retries})")
-                time.sleep(wait_time)
+            try:
+                # Only the request itself holds a semaphore slot, backoff sleeps do not
+                async with self.sem, self.limiter:
+                    sent_at = time.monotonic()
+                    async with self.session.get(url) as response:
+                        self.request_count += 1
+                        status = response.status
+                        headers = response.headers
+                        retry_after = self._parse_retry_after(headers.get("Retry-After"))
+                        data = orjson.loads(await response.read()) if status == 200 else None
                 
-                # Increase the adaptive delay
-                self._adjust_delay(False)
+                # Rate limiting and client errors mean the server is up, only 5xx count against it
+                self._record_outcome(status < 500, probe)
                 
-                if retry_count < max_retries:
-                    return self.get_autocomplete_suggestions(query, retry_count + 1, max_retries)
-                else:
-                    logging.error(f"Max retries reached for query '{query}'. Skipping.")
-                    return []
-            
-            if response.status_code != 200:
-                logging.error(f"Error status code: {response.status_code}")
+                # Handle rate limiting, preferring the server's Retry-After over our own backoff
+                if status == 429:
+                    if retry_after is not None:
+                        wait_time = retry_after
+                    else:
+                        # Full-jitter exponential backoff capped at 30 seconds, so workers don't retry in lockstep
+                        wait_time = random.uniform(0, min(30, 2 ** retry_count))
+                    logger.warning("Rate limited. Sleeping for %.2f seconds. (Retry %d/%d)", wait_time, retry_count + 1, max_retries)
+                    await asyncio.sleep(wait_time)
+                    
+                    # Increase the adaptive delay
+                    self._adjust_delay(False, sent_at)
+                    continue
                 
-                # Handle other server errors with backoff
-                if response.status_code >= 500:
-                    wait_time = min(10, 1 + retry_count)
-                    logging.warning(f"Server error. Sleeping for {wait_time} seconds.")
-                    time.sleep(wait_time)
+                if status != 200:
+                    logger.error("Error status code: %d", status)
                     
-                    if retry_count < max_retries:
-                        return self.get_autocomplete_suggestions(query, retry_count + 1, max_retries)
+                    # Handle other server errors with backoff
+                    if status >= 500:
+                        wait_time = min(10, 1 + retry_count)
+                        logger.warning("Server error. Sleeping for %s seconds.", wait_time)
+                        await asyncio.sleep(wait_time)
+                        continue
+                    
+                    return []
                 
-                return []
-            
-            data = response.json()
-            
-            if "results" in data and isinstance(data["results"], list):
-                suggestions = data["results"]
-                logging.info(f"Query '{query}' returned {len(suggestions)} suggestions (count: {data.get('count', 'N/A')})")
+                # Pace from the server's rate limit headers, falling back to heuristics without them
+                if not self._apply_rate_limit_headers(headers):
+                    self._adjust_delay(True)  # True indicates a successful request
                 
-                if suggestions and len(suggestions) > 0:
-                    logging.debug(f"First: {suggestions[0]}, Last: {suggestions[-1]}")
+                if "results" in data and isinstance(data["results"], list):
+                    suggestions = data["results"]
+                    logger.info("Query '%s' returned %d suggestions (count: %s)", query, len(suggestions), data.get('count', 'N/A'))
+                    
+                    if suggestions and logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("First: %s, Last: %s", suggestions[0], suggestions[-1])
+                    
+                    # Write through so a rerun with --resume skips this prefix
+                    self._cache[cache_key] = (suggestions, time.time())
+                    
+                    return suggestions
+                else:
+                    logger.warning("Unexpected response format: %s", data.keys())
+                    return []
                 
-                return suggestions
-            else:
-                logging.warning(f"Unexpected response format: {data.keys()}")
-                return []
-            
-        except requests.exceptions.RequestException as e:
-            wait_time = min(30, 2 ** retry_count)
-            logging.error(f"Request error querying '{query}': {str(e)}. Retrying in {wait_time}s")
-            time.sleep(wait_time)
-            
-            if retry_count < max_retries:
-                return self.get_autocomplete_suggestions(query, retry_count + 1, max_retries)
-            else:
-                logging.error(f"Max retries reached. Skipping query '{query}'")
-                return []
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._record_outcome(False, probe)
+                wait_time = random.uniform(0, min(30, 2 ** retry_count))
+                logger.error("Request error querying '%s': %s. Retrying in %.2fs", query, e, wait_time)
+                await asyncio.sleep(wait_time)
                 
-        except Exception as e:
-            logging.error(f"Unexpected error querying '{query}': {str(e)}")
-            time.sleep(5)
-            return []
+            except Exception as e:
+                # Record the failure so an unexpected error can never leave a probe in flight
+                self._record_outcome(False, probe)
+                logger.error("Unexpected error querying '%s': %s", query, e)
+                await asyncio.sleep(5)
+                return []
+        
+        logger.error("Max retries reached for query '%s'. Skipping.", query)
+        return []
     
     def crawl_autocomplete(self):
-        logging.info(f"Starting extraction with max_results={self.max_results}")
+        logger.info("Starting extraction with max_results=%d and %d concurrent requests", self.max_results, self.max_concurrency)
         start_time = time.time()
         
-        # Start with single alphanumeric characters (0-9, a-z)
-        for first_char in self.charset:
-            self.explore_prefix(first_char)
+        if self.resume:
+            self._load_names()
+        
+        self._cache = shelve.open(self.cache_file)
+        self._names_sink = open(self.names_file, 'ab' if self.resume else 'wb')
+        try:
+            asyncio.run(self.crawl())
+        finally:
+            self._cache.close()
+            self._names_sink.close()
             
         elapsed_time = time.time() - start_time
-        logging.info(f"Extraction completed in {elapsed_time:.2f} seconds")
-        logging.info(f"Total API requests: {self.request_count}")
-        logging.info(f"Total names discovered: {len(self.discovered_names)}")
+        logger.info("Extraction completed in %.2f seconds", elapsed_time)
+        logger.info("Total API requests: %d", self.request_count)
+        logger.info("Prefixes served from cache: %d", self.cache_hits)
+        logger.info("Total names discovered: %d", len(self.discovered_names))
         
         return self.discovered_names
     
-    def explore_prefix(self, prefix):
+    async def crawl(self):
         """
-        Explore a prefix and all necessary follow-up prefixes.
+        Run a pool of workers over the prefix queue until every prefix is explored.
+        """
+        self.sem = asyncio.Semaphore(self.max_concurrency)
+        self.prefix_queue = asyncio.Queue()
+        
+        # One keep-alive pool for the whole crawl; idle sockets outlive backoff sleeps
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=3, sock_read=10)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            self.session = session
+            
+            # Start with single alphanumeric characters (0-9, a-z)
+            for first_char in self.charset:
+                self._enqueue(first_char)
+            
+            workers = [asyncio.create_task(self.worker()) for _ in range(self.max_concurrency)]
+            await self.prefix_queue.join()
+            
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+    
+    async def worker(self):
+        """Pull prefixes off the queue until crawl() cancels us"""
+        while True:
+            prefix = await self.prefix_queue.get()
+            try:
+                await self.explore_prefix(prefix)
+            except Exception as e:
+                logger.error("Error exploring prefix '%s': %s", prefix, e)
+            finally:
+                self.prefix_queue.task_done()
+    
+    async def explore_prefix(self, prefix):
+        """
+        Explore a prefix and queue all necessary follow-up prefixes.
         Takes the second letter of the last result when needed to optimize the exploration.
         Handles both numbers and letters.
         """
-        logging.info(f"Processing prefix: '{prefix}'")
+        logger.info("Processing prefix: '%s'", prefix)
+        
+        # Bind what the fan-out below uses to locals, saving attribute lookups per child
+        max_results = self.max_results
+        charset = self.charset
+        enqueue = self._enqueue
+        prefix_len = len(prefix)
         
-        suggestions = self.get_autocomplete_suggestions(prefix)
+        suggestions = await self.get_autocomplete_suggestions(prefix)
+        saturated = len(suggestions) >= max_results
         
-        # Add all suggestions to our discovered names
-        for name in suggestions:
-            self.discovered_names.add(name)
+        # Add all suggestions to our discovered names in one set operation, logging the new ones to the NDJSON file
+        new_names = set(suggestions).difference(self.discovered_names)
+        if new_names:
+            self.discovered_names.update(new_names)
+            self._names_sink.write(b"".join(orjson.dumps(name) + b"\n" for name in new_names))
+            self._names_sink.flush()
         
-        # If we got exactly max_results, we need to explore further
-        if len(suggestions) == self.max_results:
+        # If we got max_results (or more, should the server ever overshoot), we need to explore further
+        if saturated:
             last_result = suggestions[-1]
             
-            if len(prefix) < len(last_result):
+            if prefix_len < len(last_result):
                 # Take the next character from the last result
-                next_char = last_result[len(prefix)]
-                next_prefix = prefix + next_char
-                self.explore_prefix(next_prefix)
+                next_char = last_result[prefix_len]
+                enqueue(prefix + next_char)
                 
                 # Now, continue with the remaining characters of our charset
-                # Start from the character after the one we just used
-                for c in self.charset:
-                    if c > next_char:  # Only try characters after the one we already used
-                        new_prefix = prefix + c
-                        self.explore_prefix(new_prefix)
+                # The charset is sorted, so the characters after the one we just used are a slice
+                for c in charset[bisect_right(charset, next_char):]:
+                    enqueue(prefix + c)
             else:
                 # This is an edge case - if the last result is exactly the prefix
                 # Try all characters as we don't know where to go next
-                for c in self.charset:
-                    new_prefix = prefix + c
-                    self.explore_prefix(new_prefix)
+                for c in charset:
+                    enqueue(prefix + c)
+    
+    def _enqueue(self, prefix):
+        """
+        Queue a prefix for exploration unless it was already scheduled.
+        The queue is FIFO, so prefixes are explored breadth-first.
+        Only saturated prefixes queue children, so no ancestor of a queued prefix
+        can already have listed every name under it.
+        """
+        if prefix in self._scheduled:
+            return
+        self._scheduled.add(prefix)
+        self.prefix_queue.put_nowait(prefix)
+    
+    def _load_names(self):
+        """Preload names logged to the NDJSON file by a previous run"""
+        if not os.path.exists(self.names_file):
+            return
+        
+        line = b""
+        with open(self.names_file, 'rb') as f:
+            for line in f:
+                try:
+                    self.discovered_names.add(orjson.loads(line))
+                except orjson.JSONDecodeError:
+                    # A crash can leave a truncated last line behind
+                    logger.warning("Skipping malformed line in %s", self.names_file)
+        
+        # Terminate a truncated last line so appended names start on a line of their own
+        if line and not line.endswith(b"\n"):
+            with open(self.names_file, 'ab') as f:
+                f.write(b"\n")
         
-        # Use adaptive delay between requests
-        self._adjust_delay(True)  # True indicates a successful request
-        time.sleep(self.adaptive_delay)
+        logger.info("Loaded %d names from %s", len(self.discovered_names), self.names_file)
     
     def save_results(self, output_file="discovered_names.json"):
         results = {
             "total_requests": self.request_count,
             "total_names": len(self.discovered_names),
-            "names": sorted(list(self.discovered_names))
+            "names": sorted(self.discovered_names)
         }
         
-        with open(output_file, 'w') as f:
-            json.dump(results, f, indent=2)
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
         
-        logging.info(f"Results saved to {output_file}")
+        logger.info("Results saved to %s", output_file)
 
 
-    def _adjust_delay(self, success):
+    def _adjust_delay(self, success, sent_at=None):
         """
-        Adaptively adjust the delay between requests based on success or failure.
-        Increases delay on failures, gradually decreases on consecutive successes.
+        AIMD control of the request rate: every success adds rate_step to it (additive increase),
+        every congestion event doubles the delay between requests (multiplicative decrease).
+        Failures of requests sent before the last doubling belong to the same event and are ignored.
         """
         if success:
-            self.consecutive_success += 1
-            # After 10 consecutive successes, slightly reduce delay
-            if self.consecutive_success > 10:
-                self.adaptive_delay = max(self.min_adaptive_delay, 
-                                         self.adaptive_delay * 0.95)
-                self.consecutive_success = 0
-                logging.info(f"Reduced delay to {self.adaptive_delay:.2f}s after consecutive successes")
+            self.adaptive_delay = max(self.min_adaptive_delay,
+                                     1 / (1 / self.adaptive_delay + self.rate_step))
+            logger.debug("Reduced delay to %.2fs after success", self.adaptive_delay)
         else:
-            # On failure, increase delay by 50% and reset success counter
+            if sent_at is not None and sent_at < self._last_decrease:
+                return
+            self._last_decrease = time.monotonic()
             self.adaptive_delay = min(self.max_adaptive_delay,
-                                     self.adaptive_delay * 1.5)
-            self.consecutive_success = 0
-            logging.info(f"Increased delay to {self.adaptive_delay:.2f}s after failure")
+                                     self.adaptive_delay * 2)
+            logger.info("Increased delay to %.2fs after failure", self.adaptive_delay)
+
+    async def _wait_for_breaker(self):
+        """
+        Wait while the circuit breaker is open.
+        Once the cooldown has passed the breaker is half-open and lets a single probe through.
+        Returns True if the caller's request is that probe.
+        """
+        while True:
+            wait_time = self._breaker_open_until - time.monotonic()
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+            elif not self._breaker_half_open:
+                return False
+            elif self._breaker_probe_in_flight:
+                await asyncio.sleep(1)
+            else:
+                self._breaker_probe_in_flight = True
+                return True
+
+    def _record_outcome(self, success, probe):
+        """
+        Feed a request outcome to the circuit breaker.
+        The breaker opens when more than half of the last 20 requests failed, and a half-open
+        breaker closes or reopens on the outcome of its probe.
+        """
+        if probe and self._breaker_half_open:
+            self._breaker_probe_in_flight = False
+            if success:
+                self._breaker_half_open = False
+                logger.info("Circuit breaker closed after a successful probe")
+            else:
+                self._open_breaker()
+            return
+        
+        self._failure_window.append(success)
+        window_full = len(self._failure_window) == self._failure_window.maxlen
+        if not self._breaker_half_open and window_full and self._failure_window.count(False) > len(self._failure_window) / 2:
+            self._open_breaker()
+
+    def _open_breaker(self):
+        self._breaker_open_until = time.monotonic() + self.breaker_cooldown
+        self._breaker_half_open = True
+        self._failure_window.clear()
+        logger.warning("Circuit breaker open for %ss after repeated failures", self.breaker_cooldown)
+
+    def _apply_rate_limit_headers(self, headers):
+        """
+        Drive the adaptive delay from the X-RateLimit-Remaining and X-RateLimit-Reset headers.
+        Returns False when the server doesn't send them, so the caller can fall back to _adjust_delay.
+        """
+        try:
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset = float(headers["X-RateLimit-Reset"])
+        except (KeyError, ValueError):
+            return False
+        
+        # Reset is either seconds until the window ends or an epoch timestamp
+        if reset > 1e9:
+            reset -= time.time()
+        
+        previous_delay = self.adaptive_delay
+        
+        if remaining < 5:
+            # Nearly out of budget, spread what is left over the rest of the window
+            self.adaptive_delay = max(self.adaptive_delay, reset / max(1, remaining))
+        else:
+            # Plenty of budget left, go back to the permitted rate
+            self.adaptive_delay = self.min_adaptive_delay
+        
+        if self.adaptive_delay != previous_delay:
+            logger.info("Rate limit headers set delay to %.2fs (%d requests left, reset in %.1fs)", self.adaptive_delay, remaining, reset)
+        
+        return True
+
+    def _parse_retry_after(self, value):
+        """
+        Parse a Retry-After header given either as delay seconds or as an HTTP-date.
+        Returns the number of seconds to wait, or None if the header is missing or malformed.
+        """
+        if value is None:
+            return None
+        
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    async def _throttle(self):
+        """
+        Space requests adaptive_delay apart across all workers while the server is pushing back.
+        At the permitted rate this is a no-op and the token bucket alone paces requests.
+        """
+        if self.adaptive_delay <= self.min_adaptive_delay:
+            return
+        
+        # Reserve the next free slot; changes to adaptive_delay apply from the next reservation on
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.adaptive_delay
+        await asyncio.sleep(slot - now)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Extract all names from the v2 autocomplete API")
+    parser.add_argument("--resume", action="store_true", help="Reuse prefix responses cached by a previous run")
+    parser.add_argument("--concurrency", type=int, default=15, help="Number of prefixes crawled in parallel (default: 15)")
+    parser.add_argument("--rps", type=float, default=2.0, help="Requests per second the server tolerates (default: 2.0)")
+    args = parser.parse_args()
+    if args.concurrency <= 0:
+        parser.error("--concurrency must be a positive integer")
+    if not args.rps > 0:
+        parser.error("--rps must be a positive number")
+    
     extractor = AutocompleteExtractor(
         base_url="http://35.200.185.69:8000",  # Update with your actual API base URL
         max_results=75,  # Updated to use the correct max_results value
-        rate_limit_delay=0.5  # Start with a higher base delay
+        permitted_rps=args.rps,  # Requests per second the server tolerates
+        max_concurrency=args.concurrency,  # Concurrent in-flight requests
+        resume=args.resume
     )
     
     all_names = extractor.crawl_autocomplete()
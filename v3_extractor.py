@@ -1,56 +1,131 @@
-import requests
+import aiohttp
+import asyncio
+import atexit
 import time
-import json
 import logging
+import logging.handlers
+import orjson
 import string
-import threading
-import queue
 import os
 import random
-from concurrent.futures import ThreadPoolExecutor
+import heapq
+import queue
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from aiolimiter import AsyncLimiter
 
-# Configure logging
+# Configure logging; the log file is written by a background listener so workers never wait on disk
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+_log_queue = queue.Queue(-1)
+_file_handler = logging.FileHandler("autocomplete_extraction_v3.log")
+_file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))  # The listener's file handler adds the rest
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
+    format=LOG_FORMAT,
     handlers=[
-        logging.FileHandler("autocomplete_extraction_v3.log"),
+        _queue_handler,
         logging.StreamHandler()
     ]
 )
+logger = logging.getLogger(__name__)
+
+# Started at import so every record is written, and stopped at exit so queued records are flushed
+_log_listener = logging.handlers.QueueListener(_log_queue, _file_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+class PrefixQueue:
+    """
+    Heap of (priority, prefix) items for workers sharing one event loop, with the
+    get/put_nowait/task_done/join interface of asyncio.PriorityQueue. Waiting workers
+    are only woken when the heap goes from empty to non-empty, not on every put.
+    """
+    def __init__(self):
+        self._heap = []
+        self._unfinished = 0  # Items put but not yet marked done, for join()
+        self._not_empty = asyncio.Event()
+        self._all_done = asyncio.Event()
+        self._all_done.set()
+    
+    def qsize(self):
+        return len(self._heap)
+    
+    def put_nowait(self, item):
+        if not self._heap:
+            self._not_empty.set()
+        heapq.heappush(self._heap, item)
+        self._unfinished += 1
+        self._all_done.clear()
+    
+    def put_many(self, items):
+        """Put a batch of items with one wake-up, heapifying when the batch is large next to the heap"""
+        if not items:
+            return
+        if not self._heap:
+            self._not_empty.set()
+        # heapify is O(heap + batch), pushing one by one O(batch * log heap); rebuild only when that is cheaper
+        if len(items) * 8 > len(self._heap):
+            self._heap.extend(items)
+            heapq.heapify(self._heap)
+        else:
+            for item in items:
+                heapq.heappush(self._heap, item)
+        self._unfinished += len(items)
+        self._all_done.clear()
+    
+    async def get(self):
+        while not self._heap:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return heapq.heappop(self._heap)
+    
+    def task_done(self):
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._all_done.set()
+    
+    async def join(self):
+        await self._all_done.wait()
 
 class AutocompleteExtractor:
-    def __init__(self, base_url, max_results=100, rate_limit_delay=1.0, max_workers=5, checkpoint_interval=200):
+    def __init__(self, base_url, max_results=100, permitted_rps=8.0, max_workers=5, checkpoint_interval=200):
         self.base_url = base_url
         self.max_results = max_results
-        self.rate_limit_delay = rate_limit_delay
+        self.permitted_rps = permitted_rps
         self.max_workers = max_workers
         self.checkpoint_interval = checkpoint_interval
         
-        # Thread-safe data structures
+        # The endpoint never changes; the query goes in params= so aiohttp encodes special characters
+        self._endpoint = f"{base_url}/v3/autocomplete"
+        
+        # Shared state; every task runs on the one event loop, so no locks are needed. The checkpoint
+        # writer and log listener threads only receive records through queues and never touch these
         self.discovered_names = set()
-        self.names_lock = threading.Lock()
         self.request_count = 0
-        self.request_count_lock = threading.Lock()
         self.explored_prefixes = set()
-        self.explored_prefixes_lock = threading.Lock()
-        
-        # Queue for prefixes to explore
-        self.prefix_queue = queue.PriorityQueue()  # Use priority queue to explore shorter prefixes first
-        
-        # Thread management
-        self.active_threads = 0
-        self.active_threads_lock = threading.Lock()
+        self.seen_prefixes = set()  # Queued or explored, so each prefix is queued at most once
         
         # Rate limiting
-        self.adaptive_delay = rate_limit_delay
-        self.max_adaptive_delay = 3.0  # Maximum delay in seconds
-        self.min_adaptive_delay = 0.8  # Higher minimum delay to avoid rate limits
-        self.delay_lock = threading.Lock()
+        self.adaptive_delay = 1 / permitted_rps  # Seconds per request across all workers
+        self.min_adaptive_delay = self.adaptive_delay  # Never go faster than the permitted rate
+        # At most 3s per request per worker, so never slower than max_workers requests every 3s
+        self.max_adaptive_delay = max(self.min_adaptive_delay, 3.0 / max_workers)
         self.rate_limit_counters = {"success": 0, "failure": 0}
+        self._next_slot = 0.0  # Event loop time at which the throttle admits the next request
+        self._rng = random.Random()  # Backoff jitter from our own generator rather than the shared module-level one
         
-        # Checkpoint system
+        # Token bucket shared by all workers, undershooting the server's cap slightly
+        self.limiter = AsyncLimiter(permitted_rps * 0.95, 1)
+        
+        # Checkpoint system: a full JSON snapshot written on exit, plus an append-only JSONL log
+        # of each explored prefix and its new names, written by a background thread
         self.checkpoint_file = "autocomplete_checkpoint_v3.json"
+        self.checkpoint_log_file = "autocomplete_checkpoint_v3.jsonl"
+        self._checkpoint_queue = queue.Queue()
         
         # Define initial character set with optimization - start with most common characters first
         # Focus on alphanumeric first, then special chars if needed
@@ -58,383 +133,414 @@ class AutocompleteExtractor:
         # We add special characters at a lower priority - the API likely prioritizes alphanumeric chars
         self.special_charset = string.punctuation.replace('\\', '').replace('"', '').replace('\'', '')
         self.full_charset = self.charset + self.special_charset
+        # Lookup forms for the branching hot path: O(1) membership, and a sorted tuple so the
+        # characters after a given one are a slice found by bisection
+        self.charset_set = frozenset(self.charset)
+        self.full_charset_tuple = tuple(sorted(self.full_charset))
         
         # Statistics
-        self.start_time = time.time()
-        self.last_status_time = time.time()
-        self.last_checkpoint_time = time.time()
+        self.start_time = time.monotonic()
         
         # Success rate tracking by prefix length for adaptive strategy
         self.prefix_length_stats = {}
         
-    def get_autocomplete_suggestions(self, query, retry_count=0, max_retries=8):
+        # Created inside the event loop by _crawl_async()
+        self.session = None
+        self.task_slots = None
+        self.prefix_queue = None  # Priority queue, so shorter prefixes are explored first
+        
+    async def get_autocomplete_suggestions(self, query, max_retries=8):
         """
         Get autocomplete suggestions with enhanced rate limit handling
         """
-        # Use a session for connection pooling
-        session = requests.Session()
+        # Query the v3 API endpoint; the longer timeouts are set on the session
+        params = {'query': query, 'max_results': self.max_results}
         
-        try:
-            # Add small jitter to request timing
-            jitter = random.uniform(0, 0.3)
-            time.sleep(jitter)
-            
-            # Use the v3 API endpoint with longer timeout
-            url = f"{self.base_url}/v3/autocomplete?query={query}&max_results={self.max_results}"
-            
-            headers = {
-                'User-Agent': f'AutocompleteExtractor/1.0 (Query: {query[:10]}...)'
-            }
-            
-            response = session.get(url, headers=headers, timeout=(5, 30))
+        # Retry in a loop rather than recursing, so retries never grow the stack
+        for retry_count in range(max_retries + 1):
+            await self._throttle()
             
-            with self.request_count_lock:
-                self.request_count += 1
-                # Save checkpoint periodically based on both time and request count
-                current_time = time.time()
-                if (self.request_count % self.checkpoint_interval == 0) or (current_time - self.last_checkpoint_time > 300):  # 5 minutes
-                    self._save_checkpoint()
-                    self.last_checkpoint_time = current_time
-            
-            # Handle rate limiting with exponential backoff
-            if response.status_code == 429:
-                # Increase the failure counter
-                with self.delay_lock:
-                    self.rate_limit_counters["failure"] += 1
-                
-                # Calculate wait time with exponential backoff and randomized jitter
-                wait_time = min(90, (2 ** retry_count) * (1 + random.uniform(0, 0.3)))
-                logging.warning(f"Rate limited. Sleeping for {wait_time:.2f} seconds. (Retry {retry_count+1}/{max_retries})")
-                time.sleep(wait_time)
+            try:
+                async with self.limiter:
+                    async with self.session.get(self._endpoint, params=params) as response:
+                        self.request_count += 1
+                        status = response.status
+                        headers = response.headers
+                        retry_after = self._parse_retry_after(headers.get("Retry-After"))
+                        data = orjson.loads(await response.read()) if status == 200 else None
                 
-                # Increase the adaptive delay significantly
-                self._adjust_delay(False)
+                # Handle rate limiting, preferring the server's Retry-After over our own backoff
+                if status == 429:
+                    # Increase the failure counter
+                    self.rate_limit_counters["failure"] += 1
+                    
+                    if retry_after is not None:
+                        wait_time = retry_after
+                    else:
+                        # Calculate wait time with exponential backoff and randomized jitter
+                        wait_time = min(90, (2 ** retry_count) * (1 + self._rng.uniform(0, 0.3)))
+                    logger.warning("Rate limited. Sleeping for %.2f seconds. (Retry %d/%d)", wait_time, retry_count + 1, max_retries)
+                    await asyncio.sleep(wait_time)
+                    
+                    # Increase the adaptive delay significantly
+                    self._adjust_delay(False)
+                    continue
                 
-                if retry_count < max_retries:
-                    # Close the session before recursive call
-                    session.close()
-                    return self.get_autocomplete_suggestions(query, retry_count + 1, max_retries)
-                else:
-                    logging.error(f"Max retries reached for query '{query}'. Skipping.")
-                    session.close()
+                if status != 200:
+                    logger.error("Error status code: %d for query '%s'", status, query)
+                    
+                    # Handle other server errors with backoff
+                    if status >= 500:
+                        wait_time = min(45, (1 + retry_count) * 5)
+                        logger.warning("Server error. Sleeping for %s seconds.", wait_time)
+                        await asyncio.sleep(wait_time)
+                        continue
+                    
                     return []
-            
-            if response.status_code != 200:
-                logging.error(f"Error status code: {response.status_code} for query '{query}'")
                 
-                # Handle other server errors with backoff
-                if response.status_code >= 500:
-                    wait_time = min(45, (1 + retry_count) * 5)
-                    logging.warning(f"Server error. Sleeping for {wait_time} seconds.")
-                    time.sleep(wait_time)
+                if "results" in data and isinstance(data["results"], list):
+                    suggestions = data["results"]
+                    count = data.get('count', 'N/A')
+                    logger.debug("Query '%s' returned %d suggestions (count: %s)", query, len(suggestions), count)
                     
-                    if retry_count < max_retries:
-                        session.close()
-                        return self.get_autocomplete_suggestions(query, retry_count + 1, max_retries)
-                
-                session.close()
-                return []
-            
-            data = response.json()
-            
-            if "results" in data and isinstance(data["results"], list):
-                suggestions = data["results"]
-                count = data.get('count', 'N/A')
-                logging.info(f"Query '{query}' returned {len(suggestions)} suggestions (count: {count})")
-                
-                if suggestions and len(suggestions) > 0:
-                    logging.debug(f"First: {suggestions[0]}, Last: {suggestions[-1]}")
-                
-                # Update prefix length stats
-                prefix_len = len(query)
-                if prefix_len not in self.prefix_length_stats:
-                    self.prefix_length_stats[prefix_len] = {"success": 0, "queries": 0}
-                self.prefix_length_stats[prefix_len]["queries"] += 1
-                if len(suggestions) > 0:
-                    self.prefix_length_stats[prefix_len]["success"] += 1
-                
-                # Successful request, adjust delay
-                with self.delay_lock:
+                    if suggestions and logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("First: %s, Last: %s", suggestions[0], suggestions[-1])
+                    
+                    # Update prefix length stats
+                    prefix_len = len(query)
+                    if prefix_len not in self.prefix_length_stats:
+                        self.prefix_length_stats[prefix_len] = {"success": 0, "queries": 0}
+                    self.prefix_length_stats[prefix_len]["queries"] += 1
+                    if len(suggestions) > 0:
+                        self.prefix_length_stats[prefix_len]["success"] += 1
+                    
+                    # Successful request, pace from the server's rate limit headers or fall back to adjusting the delay
                     self.rate_limit_counters["success"] += 1
-                self._adjust_delay(True)
+                    if not self._apply_rate_limit_headers(headers):
+                        self._adjust_delay(True)
+                    
+                    return suggestions
+                else:
+                    logger.warning("Unexpected response format: %s", data.keys())
+                    return []
                 
-                session.close()
-                return suggestions
-            else:
-                logging.warning(f"Unexpected response format: {data.keys()}")
-                session.close()
-                return []
-            
-        except requests.exceptions.RequestException as e:
-            # Exponential backoff for network errors
-            wait_time = min(45, (2 ** retry_count) * 2)
-            logging.error(f"Request error querying '{query}': {str(e)}. Retrying in {wait_time}s")
-            time.sleep(wait_time)
-            
-            if retry_count < max_retries:
-                # Clean up session before recursing
-                try:
-                    session.close()
-                except:
-                    pass
-                return self.get_autocomplete_suggestions(query, retry_count + 1, max_retries)
-            else:
-                logging.error(f"Max retries reached. Skipping query '{query}'")
-                try:
-                    session.close()
-                except:
-                    pass
-                return []
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # Exponential backoff for network errors
+                wait_time = min(45, (2 ** retry_count) * 2)
+                logger.error("Request error querying '%s': %s. Retrying in %ss", query, e, wait_time)
+                await asyncio.sleep(wait_time)
                 
-        except Exception as e:
-            logging.error(f"Unexpected error querying '{query}': {str(e)}")
-            time.sleep(8)  # Longer sleep for unexpected errors
-            try:
-                session.close()
-            except:
-                pass
-            return []
+            except Exception as e:
+                logger.error("Unexpected error querying '%s': %s", query, e)
+                await asyncio.sleep(8)  # Longer sleep for unexpected errors
+                return []
+        
+        logger.error("Max retries reached. Skipping query '%s'", query)
+        return []
     
     def crawl_autocomplete(self):
         """
-        Main crawling function that controls the threadpool and manages the work queue
+        Main crawling function that runs the event loop and reports the final statistics
         """
-        logging.info(f"Starting extraction with max_results={self.max_results} and {self.max_workers} workers")
-        logging.info(f"Initial delay: {self.adaptive_delay}s, Min: {self.min_adaptive_delay}s, Max: {self.max_adaptive_delay}s")
-        logging.info(f"Primary character set: {self.charset}")
-        logging.info(f"Special characters: {self.special_charset}")
+        logger.info("Starting extraction with max_results=%d and %d workers", self.max_results, self.max_workers)
+        logger.info("Initial delay: %ss, Min: %ss, Max: %ss", self.adaptive_delay, self.min_adaptive_delay, self.max_adaptive_delay)
+        logger.info("Primary character set: %s", self.charset)
+        logger.info("Special characters: %s", self.special_charset)
         
-        self.start_time = time.time()
-        
-        # Try to load checkpoint first
-        if self._load_checkpoint():
-            logging.info(f"Resumed from checkpoint with {len(self.discovered_names)} names and {len(self.explored_prefixes)} explored prefixes")
-        else:
-            # Initialize with single character prefixes - add as priority items (priority, item)
-            # Lower number = higher priority
-            
-            # First add all alphanumeric characters (higher priority)
-            for first_char in self.charset:
-                self.prefix_queue.put((1, first_char))  # Priority 1 for single-char alphanumeric prefixes
-            
-            # Then add special characters (lower priority)
-            for first_char in self.special_charset:
-                self.prefix_queue.put((2, first_char))  # Priority 2 for special characters
-                
-            logging.info(f"Starting fresh with {self.prefix_queue.qsize()} initial prefixes")
+        self.start_time = time.monotonic()
         
         try:
-            # Create a thread pool
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                # Start worker threads
-                workers = []
-                for _ in range(self.max_workers):
-                    workers.append(executor.submit(self.worker))
-                    
-                # Monitor progress and provide status updates
-                while not self.prefix_queue.empty() or self.active_threads > 0:
-                    queue_size = self.prefix_queue.qsize()
-                    with self.active_threads_lock:
-                        active = self.active_threads
-                    
-                    with self.request_count_lock:
-                        requests = self.request_count
-                    
-                    with self.names_lock:
-                        names = len(self.discovered_names)
-                    
-                    current_time = time.time()
-                    elapsed = current_time - self.start_time
-                    
-                    # Log status update every 30 seconds
-                    if current_time - self.last_status_time > 30:
-                        self.last_status_time = current_time
-                        
-                        # Calculate rate
-                        minutes = elapsed / 60
-                        names_per_minute = names / max(minutes, 0.01)
-                        requests_per_minute = requests / max(minutes, 0.01)
-                        
-                        logging.info(f"Status: {names} names found, {requests} requests made, {queue_size} prefixes queued")
-                        logging.info(f"Rate: {names_per_minute:.1f} names/min, {requests_per_minute:.1f} requests/min")
-                        logging.info(f"Current delay: {self.adaptive_delay:.2f}s, Success/Failure: {self.rate_limit_counters['success']}/{self.rate_limit_counters['failure']}")
-                        
-                        # Log prefix length statistics
-                        if self.prefix_length_stats:
-                            logging.info("Prefix length statistics:")
-                            for length, stats in sorted(self.prefix_length_stats.items()):
-                                if stats["queries"] > 0:
-                                    success_rate = (stats["success"] / stats["queries"]) * 100
-                                    logging.info(f"  Length {length}: {stats['success']}/{stats['queries']} ({success_rate:.1f}% success)")
-                    
-                    time.sleep(1)
+            asyncio.run(self._crawl_async())
         except KeyboardInterrupt:
-            logging.info("Received keyboard interrupt, saving checkpoint before exit")
-            self._save_checkpoint()
+            logger.info("Received keyboard interrupt, saving checkpoint before exit")
         
-        elapsed_time = time.time() - self.start_time
+        elapsed_time = time.monotonic() - self.start_time
         
         # Final status
         minutes = elapsed_time / 60
         names_per_minute = len(self.discovered_names) / max(minutes, 0.01)
         requests_per_minute = self.request_count / max(minutes, 0.01)
         
-        logging.info(f"Extraction completed in {elapsed_time:.2f} seconds ({minutes:.1f} minutes)")
-        logging.info(f"Total API requests: {self.request_count}")
-        logging.info(f"Total names discovered: {len(self.discovered_names)}")
-        logging.info(f"Final rate: {names_per_minute:.1f} names/min, {requests_per_minute:.1f} requests/min")
+        logger.info("Extraction completed in %.2f seconds (%.1f minutes)", elapsed_time, minutes)
+        logger.info("Total API requests: %d", self.request_count)
+        logger.info("Total names discovered: %d", len(self.discovered_names))
+        logger.info("Final rate: %.1f names/min, %.1f requests/min", names_per_minute, requests_per_minute)
         
-        # Final checkpoint
+        # Final checkpoint, folding the log into a fresh snapshot
         self._save_checkpoint()
         
         return self.discovered_names
     
-    def worker(self):
-        """Worker thread that processes prefixes from the queue"""
-        with self.active_threads_lock:
-            self.active_threads += 1
+    async def _crawl_async(self):
+        """
+        Explore every prefix, each in its own task, with at most max_workers in flight
+        and a monitor task providing status updates
+        """
+        self.task_slots = asyncio.BoundedSemaphore(self.max_workers)
+        self.prefix_queue = PrefixQueue()
+        
+        # Try to load checkpoint first
+        resumed = self._load_checkpoint()
+        
+        # Initialize with single character prefixes - add as priority items (priority, item)
+        # Lower number = higher priority
+        # On resume this re-seeds the roots a crash left unexplored; seen_prefixes filters out the rest
+        
+        # First add all alphanumeric characters (higher priority)
+        self._enqueue_new({first_char: 1 for first_char in self.charset})  # Priority 1 for single-char alphanumeric prefixes
+        
+        # Then add special characters (lower priority)
+        self._enqueue_new({first_char: 2 for first_char in self.special_charset})  # Priority 2 for special characters
+        
+        if resumed:
+            logger.info("Resumed from checkpoint with %d names and %d explored prefixes", len(self.discovered_names), len(self.explored_prefixes))
+        else:
+            logger.info("Starting fresh with %d initial prefixes", self.prefix_queue.qsize())
+        
+        # Checkpoint records are written off the event loop, so disk I/O never stalls a worker
+        checkpoint_writer = threading.Thread(target=self._checkpoint_writer, daemon=True)
+        checkpoint_writer.start()
         
         try:
-            while True:
-                try:
-                    # Get a prefix from the queue with a timeout
-                    priority, prefix = self.prefix_queue.get(timeout=5)
-                    
-                    # Check if we've already explored this prefix (could happen if loaded from checkpoint)
-                    with self.explored_prefixes_lock:
-                        if prefix in self.explored_prefixes:
-                            self.prefix_queue.task_done()
-                            continue
-                    
-                    try:
-                        # Process this prefix
-                        self.explore_prefix(prefix)
-                        
-                        # Mark this prefix as explored
-                        with self.explored_prefixes_lock:
-                            self.explored_prefixes.add(prefix)
-                    except Exception as e:
-                        logging.error(f"Error exploring prefix '{prefix}': {str(e)}")
-                    finally:
-                        # Mark this prefix as done
-                        self.prefix_queue.task_done()
-                        
-                        # Apply adaptive delay between requests
-                        with self.delay_lock:
-                            delay = self.adaptive_delay
-                            
-                            # Apply shorter delays for longer prefixes (they're less likely to hit rate limits)
-                            prefix_len = len(prefix)
-                            if prefix_len > 3:
-                                delay = max(self.min_adaptive_delay, delay * 0.8)
-                            
-                        time.sleep(delay)
-                        
-                except queue.Empty:
-                    # Queue empty, check if all other workers are also idle
-                    if self.prefix_queue.empty():
-                        break
+            # One keep-alive pool for the whole crawl, multiplexing every worker's requests
+            connector = aiohttp.TCPConnector(limit=self.max_workers * 2, ttl_dns_cache=300)
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=30)
+            headers = {'User-Agent': 'AutocompleteExtractor/1.0'}
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+                self.session = session
+                
+                tasks = [asyncio.create_task(self.dispatch()), asyncio.create_task(self.monitor())]
+                await self.prefix_queue.join()
+                
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            # Let the writer drain what is queued, so the log is complete before the final snapshot
+            self._checkpoint_queue.put(None)
+            checkpoint_writer.join()
+    
+    async def monitor(self):
+        """Log a status update every 30 seconds until _crawl_async() cancels us"""
+        while True:
+            await asyncio.sleep(30)
+            
+            queue_size = self.prefix_queue.qsize()
+            names = len(self.discovered_names)
+            elapsed = time.monotonic() - self.start_time
+            
+            # Calculate rate
+            minutes = elapsed / 60
+            names_per_minute = names / max(minutes, 0.01)
+            requests_per_minute = self.request_count / max(minutes, 0.01)
+            
+            logger.info("Status: %d names found, %d requests made, %d prefixes queued", names, self.request_count, queue_size)
+            logger.info("Rate: %.1f names/min, %.1f requests/min", names_per_minute, requests_per_minute)
+            logger.info("Current delay: %.2fs, Success/Failure: %d/%d", self.adaptive_delay, self.rate_limit_counters['success'], self.rate_limit_counters['failure'])
+            
+            # Log prefix length statistics
+            if self.prefix_length_stats:
+                logger.info("Prefix length statistics:")
+                for length, stats in sorted(self.prefix_length_stats.items()):
+                    if stats["queries"] > 0:
+                        success_rate = (stats["success"] / stats["queries"]) * 100
+                        logger.info("  Length %d: %d/%d (%.1f%% success)", length, stats['success'], stats['queries'], success_rate)
+    
+    async def dispatch(self):
+        """
+        Start a task for each prefix as a slot frees up, until _crawl_async() cancels us.
+        The slot is taken before the prefix, so each task gets the best prefix queued at that moment.
+        """
+        running = set()  # The event loop only keeps weak references to tasks
+        while True:
+            await self.task_slots.acquire()
+            priority, prefix = await self.prefix_queue.get()
+            task = asyncio.create_task(self._explore_task(prefix))
+            running.add(task)
+            task.add_done_callback(running.discard)
+    
+    async def _explore_task(self, prefix):
+        """Explore a single prefix, then hand its slot back"""
+        try:
+            # Process this prefix
+            await self.explore_prefix(prefix)
+            
+            # Mark this prefix as explored
+            self.explored_prefixes.add(prefix)
+        except Exception as e:
+            logger.error("Error exploring prefix '%s': %s", prefix, e)
         finally:
-            with self.active_threads_lock:
-                self.active_threads -= 1
+            self._post_request()
     
-    def explore_prefix(self, prefix):
+    def _post_request(self):
+        """Mark the prefix as done and free its slot for the next one"""
+        self.prefix_queue.task_done()
+        self.task_slots.release()
+    
+    async def explore_prefix(self, prefix):
         """
         Explore a prefix and queue follow-up prefixes when needed.
-        Thread-safe version with priority queue and improved branching strategy.
+        Uses the priority queue and improved branching strategy.
         """
-        logging.info(f"Processing prefix: '{prefix}'")
+        logger.debug("Processing prefix: '%s'", prefix)
         
-        suggestions = self.get_autocomplete_suggestions(prefix)
+        suggestions = await self.get_autocomplete_suggestions(prefix)
         
-        # Add all suggestions to our discovered names (thread-safe)
-        with self.names_lock:
-            for name in suggestions:
-                self.discovered_names.add(name)
+        # Add all suggestions to our discovered names in one bulk insert, logging only the new ones
+        # Only names not already held are added, so each name is stored as exactly one str object
+        new_names = set(suggestions).difference(self.discovered_names)
+        self.discovered_names.update(new_names)
+        self._checkpoint_queue.put_nowait({"prefix": prefix, "names": list(new_names)})
         
         # If we got max_results, we need to explore further by branching out
         if len(suggestions) == self.max_results:
             last_result = suggestions[-1]
             prefix_len = len(prefix)
             
+            # Collect each follow-up prefix with its priority, then queue them in one batch
+            branches = {}
+            
             if prefix_len < len(last_result):
                 # KEY OPTIMIZATION: Take the next character from the last result
                 next_char = last_result[prefix_len]
-                next_prefix = prefix + next_char
                 
-                # Avoid re-queuing already explored prefixes
-                with self.explored_prefixes_lock:
-                    if next_prefix not in self.explored_prefixes:
-                        # Highest priority for the direct path based on last result
-                        self.prefix_queue.put((prefix_len, next_prefix))  # Highest priority
+                # Highest priority for the direct path based on last result
+                branches[prefix + next_char] = prefix_len
                 
                 # Continue with the remaining characters of our charset
                 # Start from the character AFTER the one we just used
-                charset_to_use = self.full_charset
-                for c in charset_to_use:
-                    if c > next_char:  # Only try characters after the one we already used
-                        new_prefix = prefix + c
-                        with self.explored_prefixes_lock:
-                            if new_prefix not in self.explored_prefixes:
-                                # Lower priority (higher number) for other branches
-                                # Use even lower priority for special chars
-                                priority_boost = 5 if c in self.charset else 10
-                                self.prefix_queue.put((prefix_len + priority_boost, new_prefix))
+                # A full page only covers names up to last_result, so no later character can be ruled out
+                charset_to_use = self.full_charset_tuple
+                for c in charset_to_use[bisect_right(charset_to_use, next_char):]:
+                    # Lower priority (higher number) for other branches
+                    # Use even lower priority for special chars
+                    priority_boost = 5 if c in self.charset_set else 10
+                    branches[prefix + c] = prefix_len + priority_boost
             else:
                 # This is an edge case - if the last result is exactly the prefix
                 # Try all characters as we don't know where to go next
-                for c in self.full_charset:
-                    new_prefix = prefix + c
-                    with self.explored_prefixes_lock:
-                        if new_prefix not in self.explored_prefixes:
-                            # Use different priorities for alphanumeric vs special chars
-                            priority_boost = 5 if c in self.charset else 10
-                            self.prefix_queue.put((prefix_len + priority_boost, new_prefix))
+                for c in self.full_charset_tuple:
+                    # Use different priorities for alphanumeric vs special chars
+                    priority_boost = 5 if c in self.charset_set else 10
+                    branches[prefix + c] = prefix_len + priority_boost
+            
+            # Avoid re-queuing already queued or explored prefixes
+            self._enqueue_new(branches)
+    
+    def _enqueue_new(self, branches):
+        """
+        Queue the prefixes in branches (a prefix -> priority dict) that were never queued before,
+        filtering out the rest with one set difference against seen_prefixes
+        """
+        new_prefixes = branches.keys() - self.seen_prefixes
+        self.seen_prefixes.update(new_prefixes)
+        self.prefix_queue.put_many([(branches[new_prefix], new_prefix) for new_prefix in new_prefixes])
     
     def save_results(self, output_file="discovered_names_v3.json"):
         """Save the final results to a JSON file"""
         results = {
             "total_requests": self.request_count,
             "total_names": len(self.discovered_names),
-            "names": sorted(list(self.discovered_names))
+            "names": sorted(self.discovered_names)
         }
         
         # Write to temp file first to prevent corruption on interruption
         temp_file = f"{output_file}.tmp"
-        with open(temp_file, 'w') as f:
-            json.dump(results, f, indent=2)
+        with open(temp_file, 'wb') as f:
+            f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
         
         # Rename to final filename
         os.replace(temp_file, output_file)
         
-        logging.info(f"Results saved to {output_file}")
+        logger.info("Results saved to %s", output_file)
 
     def _adjust_delay(self, success):
         """
         Adaptively adjust the delay between requests based on success or failure patterns.
         Uses a more conservative approach to reduce rate limit issues.
         """
-        with self.delay_lock:
-            if success:
-                # Calculate success ratio over recent history
-                success_ratio = self.rate_limit_counters["success"] / max(1, self.rate_limit_counters["success"] + self.rate_limit_counters["failure"])
-                
-                # Only decrease if we have a good success rate (>85%) and significant sample
-                if success_ratio > 0.85 and self.rate_limit_counters["success"] > 30:
-                    # Decrease very gradually (by 3%)
-                    self.adaptive_delay = max(self.min_adaptive_delay, 
-                                             self.adaptive_delay * 0.97)
-                    # Reset the counters but keep some history
-                    self.rate_limit_counters["success"] = 15
-                    self.rate_limit_counters["failure"] = 2
-                    logging.info(f"Decreased delay to {self.adaptive_delay:.2f}s after consistent success")
-            else:
-                # On failure, increase delay significantly and reset success counter
-                self.adaptive_delay = min(self.max_adaptive_delay,
-                                         self.adaptive_delay * 1.5)
-                # Reset success counter to be conservative
-                self.rate_limit_counters["success"] = 0
-                logging.info(f"Increased delay to {self.adaptive_delay:.2f}s after failure")
+        if success:
+            # Calculate success ratio over recent history
+            success_ratio = self.rate_limit_counters["success"] / max(1, self.rate_limit_counters["success"] + self.rate_limit_counters["failure"])
+            
+            # Only decrease if we have a good success rate (>85%) and significant sample
+            if success_ratio > 0.85 and self.rate_limit_counters["success"] > 30:
+                # Decrease very gradually (by 3%)
+                self.adaptive_delay = max(self.min_adaptive_delay, 
+                                         self.adaptive_delay * 0.97)
+                # Reset the counters but keep some history
+                self.rate_limit_counters["success"] = 15
+                self.rate_limit_counters["failure"] = 2
+                logger.info("Decreased delay to %.2fs after consistent success", self.adaptive_delay)
+        else:
+            # On failure, increase delay significantly and reset success counter
+            self.adaptive_delay = min(self.max_adaptive_delay,
+                                     self.adaptive_delay * 1.5)
+            # Reset success counter to be conservative
+            self.rate_limit_counters["success"] = 0
+            logger.info("Increased delay to %.2fs after failure", self.adaptive_delay)
+
+    def _apply_rate_limit_headers(self, headers):
+        """
+        Drive the adaptive delay from the X-RateLimit-* (or draft standard RateLimit-*)
+        Remaining and Reset headers, throttling before the server has to answer with a 429.
+        Returns False when the server doesn't send them, so the caller can fall back to _adjust_delay.
+        """
+        try:
+            remaining = int(headers.get("X-RateLimit-Remaining", headers.get("RateLimit-Remaining")))
+            reset = float(headers.get("X-RateLimit-Reset", headers.get("RateLimit-Reset")))
+        except (TypeError, ValueError):
+            return False
+        
+        # Reset is either seconds until the window ends or an epoch timestamp
+        if reset > 1e9:
+            reset -= time.time()
+        
+        previous_delay = self.adaptive_delay
+        
+        if remaining < 5:
+            # Nearly out of budget, spread what is left over the rest of the window
+            self.adaptive_delay = max(self.adaptive_delay, reset / max(1, remaining))
+        else:
+            # Plenty of budget left, go back to the permitted rate
+            self.adaptive_delay = self.min_adaptive_delay
+        
+        if self.adaptive_delay != previous_delay:
+            logger.info("Rate limit headers set delay to %.2fs (%d requests left, reset in %.1fs)", self.adaptive_delay, remaining, reset)
+        
+        return True
+
+    def _parse_retry_after(self, value):
+        """
+        Parse a Retry-After header given either as delay seconds or as an HTTP-date.
+        Returns the number of seconds to wait, or None if the header is missing or malformed.
+        """
+        if value is None:
+            return None
+        
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    async def _throttle(self):
+        """
+        Space requests adaptive_delay apart across all workers while the server is pushing back.
+        At the permitted rate this is a no-op and the token bucket alone paces requests.
+        """
+        if self.adaptive_delay <= self.min_adaptive_delay:
+            return
+        
+        # Reserve the next free slot; changes to adaptive_delay apply from the next reservation on
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.adaptive_delay
+        await asyncio.sleep(slot - now)
 
     def _save_checkpoint(self):
         """Save current progress to a checkpoint file"""
@@ -449,66 +555,105 @@ class AutocompleteExtractor:
             
             # Write to temp file first to prevent corruption
             temp_file = f"{self.checkpoint_file}.tmp"
-            with open(temp_file, 'w') as f:
-                json.dump(checkpoint_data, f)
+            # prefix_length_stats is keyed by int, which orjson only writes with OPT_NON_STR_KEYS
+            with open(temp_file, 'wb') as f:
+                f.write(orjson.dumps(checkpoint_data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE))
             
             # Rename to final filename
             os.replace(temp_file, self.checkpoint_file)
             
-            logging.info(f"Checkpoint saved with {len(self.discovered_names)} names and {len(self.explored_prefixes)} explored prefixes")
+            # Everything in the log is now in the snapshot
+            open(self.checkpoint_log_file, 'w').close()
+            
+            logger.info("Checkpoint saved with %d names and %d explored prefixes", len(self.discovered_names), len(self.explored_prefixes))
             return True
         except Exception as e:
-            logging.error(f"Error saving checkpoint: {str(e)}")
+            logger.error("Error saving checkpoint: %s", e)
             return False
     
+    def _checkpoint_writer(self):
+        """
+        Background thread appending checkpoint records to the JSONL log until it reads None.
+        Flushes whenever the queue runs dry, or at the latest every checkpoint_interval records.
+        """
+        with open(self.checkpoint_log_file, 'ab') as f:
+            unflushed = 0
+            while True:
+                record = self._checkpoint_queue.get()
+                if record is None:
+                    break
+                
+                f.write(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+                unflushed += 1
+                if unflushed >= self.checkpoint_interval or self._checkpoint_queue.empty():
+                    f.flush()
+                    unflushed = 0
+    
     def _load_checkpoint(self):
-        """Load the checkpoint file if available"""
-        if not os.path.exists(self.checkpoint_file):
+        """Load the checkpoint snapshot and replay the checkpoint log on top of it, if available"""
+        has_snapshot = os.path.exists(self.checkpoint_file)
+        has_log = os.path.exists(self.checkpoint_log_file) and os.path.getsize(self.checkpoint_log_file) > 0
+        if not has_snapshot and not has_log:
             return False
             
         try:
-            with open(self.checkpoint_file, 'r') as f:
-                checkpoint_data = json.load(f)
-            
-            # Restore discovered names
-            self.discovered_names = set(checkpoint_data.get("discovered_names", []))
-            
-            # Restore explored prefixes
-            self.explored_prefixes = set(checkpoint_data.get("explored_prefixes", []))
-            
-            # Restore request count
-            self.request_count = checkpoint_data.get("request_count", 0)
+            if has_snapshot:
+                with open(self.checkpoint_file, 'rb') as f:
+                    checkpoint_data = orjson.loads(f.read())
+                
+                # Restore discovered names
+                self.discovered_names = set(checkpoint_data.get("discovered_names", []))
+                
+                # Restore explored prefixes
+                self.explored_prefixes = set(checkpoint_data.get("explored_prefixes", []))
+                
+                # Restore request count
+                self.request_count = checkpoint_data.get("request_count", 0)
+                
+                # Restore prefix length stats if available
+                # JSON object keys are always strings, so turn the prefix lengths back into ints
+                if "prefix_length_stats" in checkpoint_data:
+                    self.prefix_length_stats = {int(length): stats for length, stats in checkpoint_data["prefix_length_stats"].items()}
             
-            # Restore prefix length stats if available
-            if "prefix_length_stats" in checkpoint_data:
-                self.prefix_length_stats = checkpoint_data["prefix_length_stats"]
+            if has_log:
+                with open(self.checkpoint_log_file, 'rb') as f:
+                    for line in f:
+                        try:
+                            record = orjson.loads(line)
+                        except ValueError:
+                            # A crash can leave the last line half-written
+                            continue
+                        self.discovered_names.update(record["names"])
+                        self.explored_prefixes.add(record["prefix"])
+                
+                # Fold the replayed log into a fresh snapshot, which also truncates it
+                self._save_checkpoint()
             
             # Queue unexplored next level prefixes using smart prioritization
             priority_base = 1000  # Start with a high priority base to ensure existing items are processed first
             
             # Group prefixes by length for better prioritization
-            prefix_by_length = {}
+            prefix_by_length = defaultdict(list)
             for prefix in self.explored_prefixes:
-                prefix_len = len(prefix)
-                if prefix_len not in prefix_by_length:
-                    prefix_by_length[prefix_len] = []
-                prefix_by_length[prefix_len].append(prefix)
+                prefix_by_length[len(prefix)].append(prefix)
             
-            # Process shorter prefixes first
-            for prefix_len in sorted(prefix_by_length.keys()):
-                for prefix in prefix_by_length[prefix_len]:
-                    for char in self.charset:
-                        new_prefix = prefix + char
-                        if new_prefix not in self.explored_prefixes:
-                            # Higher priority (lower number) for shorter prefixes
-                            self.prefix_queue.put((prefix_len + 1, new_prefix))
+            # Process shorter prefixes first, queueing them all in one batch
+            # Every candidate of a length shares one priority, so each group is filtered with one set difference
+            self.seen_prefixes = set(self.explored_prefixes)
+            batch = []
+            for prefix_len in sorted(prefix_by_length):
+                candidates = {prefix + char for prefix in prefix_by_length[prefix_len] for char in self.charset} - self.seen_prefixes
+                self.seen_prefixes.update(candidates)
+                # Higher priority (lower number) for shorter prefixes
+                batch.extend((prefix_len + 1, new_prefix) for new_prefix in candidates)
+            self.prefix_queue.put_many(batch)
             
-            logging.info(f"Checkpoint loaded with {len(self.discovered_names)} names")
-            logging.info(f"Queued {self.prefix_queue.qsize()} prefixes for exploration")
+            logger.info("Checkpoint loaded with %d names", len(self.discovered_names))
+            logger.info("Queued %d prefixes for exploration", self.prefix_queue.qsize())
             
             return True
         except Exception as e:
-            logging.error(f"Error loading checkpoint: {str(e)}")
+            logger.error("Error loading checkpoint: %s", e)
             return False
 
 
@@ -516,9 +661,9 @@ def main():
     extractor = AutocompleteExtractor(
         base_url="http://35.200.185.69:8000",
         max_results=100,             # v3 API supports 100 results
-        rate_limit_delay=1.0,        # Start with a moderate base delay
+        permitted_rps=8.0,           # Requests per second the server tolerates
         max_workers=10,               
-        checkpoint_interval=200      # Save checkpoint every 200 requests
+        checkpoint_interval=200      # Flush the checkpoint log at least every 200 prefixes
     )
     
     all_names = extractor.crawl_autocomplete()